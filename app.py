@@ -1,60 +1,53 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from sqlmodel import SQLModel, Field, Session, create_engine, select
-from passlib.context import CryptContext
+from starlette.staticfiles import NotModifiedResponse
+from sqlalchemy import text, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from cachetools import TTLCache
+import aiofiles
 import stripe
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import itertools
+import json
 import os
-import uuid
+import stat
+import time
 
-# Stripe config
-STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
-stripe.api_key = STRIPE_SECRET_KEY
+from config import STRIPE_WEBHOOK_SECRET
+from cors_config import setup_cors
+from database import LISTING_BY_ID, USER_BY_NAME, Listing, User, create_db_and_tables, get_session
+from forgot_password import router as password_reset_router
+from rate_limit import RateLimiter, start_sweeper
+from security import hash_password, needs_rehash, verify_login
+from stripe_utils import create_checkout
 
-DATABASE_URL = "sqlite:///./rcmp123.db"
 IMAGES_DIR = "images"
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-engine = create_engine(DATABASE_URL, echo=False)
+# Uploads are streamed in 1 MiB chunks, rounded up to a whole number of the
+# filesystem's preferred I/O blocks.
+_blksize = os.stat(IMAGES_DIR).st_blksize
+UPLOAD_CHUNK_SIZE = -(-(1 << 20) // _blksize) * _blksize
+_upload_counter = itertools.count()
 
-class User(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    username: str = Field(index=True, unique=True)
-    hashed_password: str
-
-class Listing(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    title: str
-    description: str
-    price: float
-    seller_id: int = Field(foreign_key="user.id")
-    image_path: str
-    sold: bool = Field(default=False)
-
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
-def get_session():
-    with Session(engine) as session:
-        yield session
+async def write_upload(path: str, upload: UploadFile):
+    # "x" so a name collision fails loudly instead of overwriting another image.
+    async with aiofiles.open(path, "xb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
 
 app = FastAPI(title="RCMP123 Backend")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.mount("/images", StaticFiles(directory=IMAGES_DIR), name="images")
+setup_cors(app)
+app.include_router(password_reset_router)
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    await create_db_and_tables()
+    app.state.rate_limit_sweeper = start_sweeper()
 
 @app.get("/")
 def root():
@@ -62,35 +55,43 @@ def root():
 
 # -------- AUTH --------
 @app.post("/register")
-def register(
+async def register(
     username: str = Form(...),
     password: str = Form(...),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ):
-    existing = session.exec(select(User).where(User.username == username)).first()
+    existing = (await session.exec(USER_BY_NAME, params={"u": username})).scalars().first()
     if existing:
         raise HTTPException(400, "Username already exists")
 
     user = User(
         username=username,
-        hashed_password=pwd_context.hash(password),
+        hashed_password=await asyncio.to_thread(hash_password, password),
     )
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     return {"id": user.id, "username": user.username}
 
-@app.post("/login")
-def login(
+@app.post("/login", dependencies=[Depends(RateLimiter("login"))])
+async def login(
     username: str = Form(...),
     password: str = Form(...),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ):
-    user = session.exec(select(User).where(User.username == username)).first()
-    if not user or not pwd_context.verify(password, user.hashed_password):
+    user = (await session.exec(USER_BY_NAME, params={"u": username})).scalars().first()
+    ok = await asyncio.to_thread(verify_login, password, user.hashed_password if user else None)
+    if not user or not ok:
         raise HTTPException(400, "Invalid Login")
 
+    # Upgrade legacy bcrypt (or outdated argon2) hashes while we have the password.
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await asyncio.to_thread(hash_password, password)
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+
     return {"id": user.id, "username": user.username}
 
 # -------- CREATE LISTING --------
@@ -101,13 +102,12 @@ async def create_listing(
     price: float = Form(...),
     seller_id: int = Form(...),
     image: UploadFile = File(...),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ):
-    filename = f"{uuid.uuid4()}_{image.filename}"
+    filename = f"{time.time_ns():x}_{next(_upload_counter):x}_{image.filename}"
     path = os.path.join(IMAGES_DIR, filename)
 
-    with open(path, "wb") as f:
-        f.write(await image.read())
+    await write_upload(path, image)
 
     listing = Listing(
         title=title,
@@ -117,39 +117,96 @@ async def create_listing(
         image_path=f"/images/{filename}",
     )
     session.add(listing)
-    session.commit()
-    session.refresh(listing)
+    await session.commit()
+    await session.refresh(listing)
+    invalidate_listings_cache()
 
     return {"listing_id": listing.id}
 
+# -------- IMAGES --------
+# Uploaded images are never rewritten (every upload gets a fresh name), so
+# clients can cache them forever.
+IMAGE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+# Only used for its conditional-GET check, so 304s match what the old mount sent.
+_image_files = StaticFiles(directory=IMAGES_DIR)
+
+@app.api_route("/images/{filename}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_image(request: Request, filename: str):
+    path = os.path.join(IMAGES_DIR, filename)
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except (OSError, ValueError):
+        # ValueError covers names with an embedded NUL byte.
+        raise HTTPException(404, "Image not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(404, "Image not found")
+
+    response = FileResponse(path, stat_result=stat_result, headers=IMAGE_HEADERS)
+    if _image_files.is_not_modified(response.headers, request.headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
 # -------- LISTINGS --------
-@app.get("/listings")
-def get_listings(session: Session = Depends(get_session)):
-    listings = session.exec(select(Listing)).all()
-    results = []
-    for listing in listings:
-        seller_username = session.exec(
-            select(User.username).where(User.id == listing.seller_id)
-        ).first()
-        results.append({
-            "id": listing.id,
-            "title": listing.title,
-            "description": listing.description,
-            "price": listing.price,
-            "image_url": listing.image_path,
+LISTINGS_CACHE_TTL = 5
+# Serialized /listings body and its ETag, dropped whenever a listing changes.
+_listings_cache = TTLCache(maxsize=1, ttl=LISTINGS_CACHE_TTL)
+# Bumped on every invalidation so a load that raced a write isn't cached.
+_listings_version = 0
+
+def invalidate_listings_cache():
+    global _listings_version
+    _listings_version += 1
+    _listings_cache.clear()
+
+async def load_listings(session: AsyncSession):
+    stmt = select(
+        Listing.id,
+        Listing.title,
+        Listing.description,
+        Listing.price,
+        Listing.image_path,
+        Listing.sold,
+        User.username,
+    ).join(User, User.id == Listing.seller_id, isouter=True)
+    rows = (await session.exec(stmt)).all()
+    return [
+        {
+            "id": listing_id,
+            "title": title,
+            "description": description,
+            "price": price,
+            "image_url": image_path,
             "seller_username": seller_username,
-            "sold": listing.sold
-        })
-    return results
+            "sold": sold
+        }
+        for listing_id, title, description, price, image_path, sold, seller_username in rows
+    ]
+
+@app.get("/listings")
+async def get_listings(request: Request, session: AsyncSession = Depends(get_session)):
+    cached = _listings_cache.get("listings")
+    if cached is None:
+        version = _listings_version
+        body = json.dumps(await load_listings(session), separators=(",", ":")).encode()
+        etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+        cached = (body, etag)
+        if version == _listings_version:
+            _listings_cache["listings"] = cached
+
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": f"max-age={LISTINGS_CACHE_TTL}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # -------- STRIPE CHECKOUT --------
 @app.post("/create_checkout_session")
 async def create_checkout_session(
     listing_id: int = Form(...),
     buyer_email: str = Form(...),
-    session_db: Session = Depends(get_session)
+    session_db: AsyncSession = Depends(get_session)
 ):
-    listing = session_db.exec(select(Listing).where(Listing.id == listing_id)).first()
+    listing = (await session_db.exec(LISTING_BY_ID, params={"i": listing_id})).scalars().first()
     if not listing:
         raise HTTPException(404, "Listing not found")
     if listing.sold:
@@ -158,55 +215,54 @@ async def create_checkout_session(
     price_cents = int(float(listing.price) * 100)
 
     try:
-        checkout = stripe.checkout.Session.create(
-            mode="payment",
-            payment_method_types=["card"],
-            customer_email=buyer_email,
-            line_items=[{
-                "price_data": {
-                    "currency": "usd",
-                    "product_data": {
-                        "name": listing.title,
-                        "images": [],
-                    },
-                    "unit_amount": price_cents
-                },
-                "quantity": 1
-            }],
-            success_url="http://localhost:8000/payment_success?listing_id={}".format(listing.id),
-            cancel_url="http://localhost:8000/payment_cancel",
-            metadata={
-                "listing_id": listing.id
-            }
-        )
+        checkout = await create_checkout(price_cents, listing.title, listing.id, buyer_email)
         return {"checkout_url": checkout.url}
     except Exception as e:
         raise HTTPException(500, f"Stripe error: {e}")
 
 @app.post("/stripe_webhook")
-async def stripe_webhook(request: Request, session_db: Session = Depends(get_session)):
-    webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+async def stripe_webhook(request: Request, session_db: AsyncSession = Depends(get_session)):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
 
-    if not webhook_secret:
+    if not STRIPE_WEBHOOK_SECRET:
         raise HTTPException(500, "Missing STRIPE_WEBHOOK_SECRET")
 
     try:
         event = stripe.Webhook.construct_event(
-            payload, sig_header, webhook_secret
+            payload, sig_header, STRIPE_WEBHOOK_SECRET
         )
     except Exception as e:
         raise HTTPException(400, f"Webhook error: {e}")
 
+    # Stripe retries deliveries and the dashboard can resend them, so record
+    # the event id first and skip anything we've already handled. The marker
+    # is committed together with the event's own writes.
+    inserted = await session_db.exec(
+        text(
+            "INSERT INTO processedstripeevent (id, type, processed_at) "
+            "VALUES (:id, :type, :processed_at) ON CONFLICT (id) DO NOTHING"
+        ),
+        params={"id": event["id"], "type": event["type"], "processed_at": datetime.now(timezone.utc)},
+    )
+    if inserted.rowcount == 0:
+        await session_db.rollback()
+        return JSONResponse({"status": "duplicate"})
+
+    marked_sold = False
     if event["type"] == "checkout.session.completed":
         data = event["data"]["object"]
         listing_id = int(data["metadata"]["listing_id"])
-        listing = session_db.exec(select(Listing).where(Listing.id == listing_id)).first()
-        if listing:
-            listing.sold = True
-            session_db.add(listing)
-            session_db.commit()
+        result = await session_db.exec(
+            update(Listing)
+            .where(Listing.id == listing_id, Listing.sold.is_(False))
+            .values(sold=True)
+        )
+        marked_sold = result.rowcount > 0
+
+    await session_db.commit()
+    if marked_sold:
+        invalidate_listings_cache()
 
     return JSONResponse({"status": "success"})
 
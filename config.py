@@ -9,6 +9,16 @@ SMTP_SERVER = os.getenv("SMTP_SERVER", "")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+# Set to 0 once no passlib bcrypt hashes remain in the user table; until then
+# every login also pays one bcrypt check so migrated and unmigrated accounts
+# can't be told apart by timing.
+LEGACY_BCRYPT_HASHES = os.getenv("LEGACY_BCRYPT_HASHES", "1") == "1"
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# The deployment sits behind one platform router; set 0 when serving directly.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
 
 RESET_TOKEN_SECRET = os.getenv("RESET_TOKEN_SECRET", "changeme12345")
 API_BASE = "http://127.0.0.1:8000"
\ No newline at end of file
@@ -0,0 +1,85 @@
+from sqlalchemy import Index, bindparam, event, lambda_stmt, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel, Field, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from filelock import FileLock
+from datetime import datetime
+
+DATABASE_URL = "sqlite+aiosqlite:///./rcmp123.db"
+DB_INIT_LOCK = "rcmp123.db.lock"
+
+# Size the pool explicitly. WAL allows a single writer, so a few connections
+# cover the concurrency SQLite can use; each one also holds its own page cache.
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=4,
+    max_overflow=4,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False},
+)
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    # Small private cache per connection; reads are mostly served from the
+    # shared memory map below.
+    "PRAGMA cache_size=-16384",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+class User(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    username: str = Field(index=True, unique=True)
+    hashed_password: str
+
+class Listing(SQLModel, table=True):
+    __table_args__ = (
+        # Partial index covering only unsold listings, the ones browsed and checked out.
+        Index("ix_listing_unsold", "id", sqlite_where=text("sold = 0")),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    title: str
+    description: str
+    price: float
+    seller_id: int = Field(foreign_key="user.id", index=True)
+    image_path: str
+    sold: bool = Field(default=False, index=True)
+
+class ProcessedStripeEvent(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    type: str
+    processed_at: datetime
+
+# Hot lookups built once as lambda statements so SQLAlchemy reuses the cached
+# compiled SQL instead of rebuilding the SELECT on every request.
+USER_BY_NAME = lambda_stmt(lambda: select(User).where(User.username == bindparam("u")))
+LISTING_BY_ID = lambda_stmt(lambda: select(Listing).where(Listing.id == bindparam("i")))
+
+_initialized = False
+
+async def create_db_and_tables():
+    global _initialized
+    if _initialized:
+        return
+    # Workers start together; serialize the DDL so they don't race CREATE TABLE.
+    # The connection this opens stays in the pool, so it also warms the engine.
+    with FileLock(DB_INIT_LOCK):
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+    _initialized = True
+
+async def get_session():
+    async with AsyncSession(engine) as session:
+        yield session
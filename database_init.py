@@ -1,8 +1,8 @@
-from sqlmodel import SQLModel, create_engine
+import asyncio
+from database import create_db_and_tables
 
 def init_db():
-    engine = create_engine("sqlite:///./rcmp123.db")
-    SQLModel.metadata.create_all(engine)
+    asyncio.run(create_db_and_tables())
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
@@ -1,8 +1,27 @@
-import smtplib
+import asyncio
 from email.mime.text import MIMEText
-from config import SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, API_BASE
 
-def send_reset_email(username: str, email: str, token: str):
+import aiosmtplib
+
+from config import SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_POOL_SIZE, API_BASE
+
+# Logged-in SMTP connections reused across sends so STARTTLS and AUTH are
+# paid once per connection instead of once per email.
+_smtp_pool: asyncio.Queue[aiosmtplib.SMTP] = asyncio.Queue()
+_smtp_created = 0
+
+async def _acquire_smtp():
+    global _smtp_created
+    if _smtp_pool.empty() and _smtp_created < SMTP_POOL_SIZE:
+        _smtp_created += 1
+        return aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT, start_tls=True)
+    return await _smtp_pool.get()
+
+async def _connect(smtp: aiosmtplib.SMTP):
+    await smtp.connect()
+    await smtp.login(SMTP_USER, SMTP_PASS)
+
+async def send_reset_email(username: str, email: str, token: str):
     link = f"{API_BASE}/reset-password?token={token}"
 
     msg = MIMEText(f"Hello {username},\n\nClick the link to reset your password:\n{link}\n\nIf not you, ignore this.")
@@ -10,7 +29,20 @@ def send_reset_email(username: str, email: str, token: str):
     msg["From"] = SMTP_USER
     msg["To"] = email
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-        smtp.starttls()
-        smtp.login(SMTP_USER, SMTP_PASS)
-        smtp.send_message(msg)
\ No newline at end of file
+    smtp = await _acquire_smtp()
+    try:
+        if not smtp.is_connected:
+            await _connect(smtp)
+        try:
+            await smtp.send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            # The server dropped an idle pooled connection; reconnect once.
+            await _connect(smtp)
+            await smtp.send_message(msg)
+    except BaseException:
+        # Includes cancellation mid-send: never pool a connection that may be
+        # left inside an SMTP transaction.
+        smtp.close()
+        raise
+    finally:
+        _smtp_pool.put_nowait(smtp)
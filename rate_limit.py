@@ -1,17 +1,102 @@
-from time import time
+import asyncio
+import secrets
+from collections import defaultdict, deque
+from time import monotonic, time
 
-attempts = {}
+from fastapi import Depends, HTTPException, Request
+from redis import RedisError
+from redis.asyncio import Redis
 
-def rate_limit(ip: str, limit: int = 5, window: int = 60):
-    now = time()
+from config import REDIS_URL, TRUSTED_PROXY_HOPS
 
-    if ip not in attempts:
-        attempts[ip] = []
+# Sliding window kept in a sorted set scored by timestamp (ms). Runs
+# server-side so the prune/count/add is atomic across every worker.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+if redis.call('ZCARD', key) >= limit then
+    return 0
+end
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('PEXPIRE', key, window)
+return 1
+"""
 
-    attempts[ip] = [t for t in attempts[ip] if now - t < window]
+redis_client = Redis.from_url(REDIS_URL) if REDIS_URL else None
+sliding_window = redis_client.register_script(SLIDING_WINDOW_LUA) if redis_client else None
 
-    if len(attempts[ip]) >= limit:
+# Per-process fallback used when REDIS_URL is not configured or Redis is down. The window each
+# key was limited with is kept so the sweeper prunes it by the same window.
+attempts: dict[str, deque[float]] = defaultdict(deque)
+windows: dict[str, int] = {}
+
+def get_redis():
+    return redis_client
+
+async def rate_limit(ip: str, limit: int = 5, window: int = 60, redis: Redis | None = None):
+    if redis is not None:
+        now = int(time() * 1000)
+        member = f"{now}-{secrets.token_hex(4)}"
+        try:
+            allowed = await sliding_window(
+                keys=[f"rate_limit:{ip}"], args=[now, window * 1000, limit, member], client=redis
+            )
+            return allowed == 1
+        except RedisError:
+            # Redis is unreachable; limit per process rather than failing the request.
+            pass
+
+    now = monotonic()
+    dq = attempts[ip]
+    windows[ip] = window
+
+    while dq and now - dq[0] >= window:
+        dq.popleft()
+
+    if len(dq) >= limit:
         return False
 
-    attempts[ip].append(now)
-    return True
\ No newline at end of file
+    dq.append(now)
+    return True
+
+def client_ip(request: Request):
+    # Behind N trusted proxies the real client is the Nth entry from the right
+    # of X-Forwarded-For; anything further left is client-supplied.
+    forwarded = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXY_HOPS and forwarded:
+        hops = [h.strip() for h in forwarded.split(",")]
+        return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+class RateLimiter:
+    def __init__(self, scope: str, limit: int = 5, window: int = 60):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    async def __call__(self, request: Request, redis: Redis | None = Depends(get_redis)):
+        ip = client_ip(request)
+        if not await rate_limit(f"{self.scope}:{ip}", self.limit, self.window, redis):
+            raise HTTPException(429, "Too many attempts, try again later")
+
+def sweep_attempts():
+    now = monotonic()
+    for ip in list(attempts):
+        dq = attempts[ip]
+        window = windows.get(ip, 0)
+        while dq and now - dq[0] >= window:
+            dq.popleft()
+        if not dq:
+            del attempts[ip]
+            windows.pop(ip, None)
+
+async def _sweep_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        sweep_attempts()
+
+def start_sweeper(interval: float = 60):
+    return asyncio.create_task(_sweep_forever(interval))
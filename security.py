@@ -1,9 +1,49 @@
-from passlib.context import CryptContext
+import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from config import LEGACY_BCRYPT_HASHES
+
+ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+# Targets for the work a login does when there is no real hash of that kind to
+# check. Building them here also warms both hashers at import.
+DUMMY_ARGON2_HASH = ph.hash("x")
+DUMMY_BCRYPT_HASH = bcrypt.hashpw(b"x", bcrypt.gensalt(12)).decode()
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return ph.hash(password)
+
+def is_legacy_hash(hash_value: str):
+    return hash_value.startswith("$2")
+
+def _verify_bcrypt(password: str, hash_value: str):
+    # bcrypt hashes written by passlib, which silently truncated at 72 bytes.
+    return bcrypt.checkpw(password.encode()[:72], hash_value.encode())
+
+def _verify_argon2(password: str, hash_value: str):
+    try:
+        return ph.verify(hash_value, password)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
 
 def verify_password(password: str, hash_value: str):
-    return pwd_context.verify(password, hash_value)
\ No newline at end of file
+    if is_legacy_hash(hash_value):
+        return _verify_bcrypt(password, hash_value)
+    return _verify_argon2(password, hash_value)
+
+def verify_login(password: str, hash_value: str | None):
+    # Unknown users, argon2 users and not-yet-migrated bcrypt users must all
+    # cost the same, so every login runs one argon2 and (while legacy hashes
+    # remain) one bcrypt check, with dummies standing in for what's missing.
+    legacy = hash_value is not None and is_legacy_hash(hash_value)
+    ok_argon2 = _verify_argon2(password, DUMMY_ARGON2_HASH if hash_value is None or legacy else hash_value)
+    ok_bcrypt = False
+    if LEGACY_BCRYPT_HASHES or legacy:
+        ok_bcrypt = _verify_bcrypt(password, hash_value if legacy else DUMMY_BCRYPT_HASH)
+    if hash_value is None:
+        return False
+    return ok_bcrypt if legacy else ok_argon2
+
+def needs_rehash(hash_value: str):
+    return is_legacy_hash(hash_value) or ph.check_needs_rehash(hash_value)
@@ -1,22 +1,23 @@
 import stripe
-from config import STRIPE_SECRET_KEY
+from config import STRIPE_SECRET_KEY, API_BASE
 
-stripe.api_key = STRIPE_SECRET_KEY
+# One shared client so requests to api.stripe.com reuse pooled httpx connections.
+stripe_client = stripe.StripeClient(STRIPE_SECRET_KEY, http_client=stripe.HTTPXClient())
 
-def create_checkout(price_cents: int, item_name: str, listing_id: int, buyer_email: str):
-    return stripe.checkout.Session.create(
-        mode="payment",
-        payment_method_types=["card"],
-        customer_email=buyer_email,
-        line_items=[{
+async def create_checkout(price_cents: int, item_name: str, listing_id: int, buyer_email: str):
+    return await stripe_client.v1.checkout.sessions.create_async(params={
+        "mode": "payment",
+        "payment_method_types": ["card"],
+        "customer_email": buyer_email,
+        "line_items": [{
             "price_data": {
                 "currency": "usd",
-                "product_data": { "name": item_name },
+                "product_data": { "name": item_name, "images": [] },
                 "unit_amount": price_cents
             },
             "quantity": 1
         }],
-        success_url=f"http://127.0.0.1:8000/payment_success?listing_id={listing_id}",
-        cancel_url="http://127.0.0.1:8000/payment_cancel",
-        metadata={ "listing_id": listing_id }
-    )
\ No newline at end of file
+        "success_url": f"{API_BASE}/payment_success?listing_id={listing_id}",
+        "cancel_url": f"{API_BASE}/payment_cancel",
+        "metadata": { "listing_id": listing_id }
+    })